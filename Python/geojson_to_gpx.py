@@ -1,194 +1,78 @@
 #!/usr/bin/env python3
 import argparse
 import html
-import json
-import re
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
-from urllib.parse import urlparse, parse_qs, unquote
-
-
-def load_json(path: Path) -> Dict[str, Any]:
-    with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
-
-
-def parse_latlon_from_url(url: str) -> Optional[Tuple[float, float]]:
-    if not url:
-        return None
-
-    # Look for ?q=lat,lon
-    m = re.search(r"[?&]q=(-?\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?)", url)
-    if m:
-        try:
-            lat, lon = float(m.group(1)), float(m.group(2))
-            return lat, lon
-        except ValueError:
-            pass
-
-    # Fallback: parse query
-    parsed = urlparse(url)
-    qs = parse_qs(parsed.query)
-    if "q" not in qs:
-        return None
-
-    q_raw = qs["q"][0]
-    q_text = unquote(q_raw.replace("+", " ")).strip()
-
-    # Check for coords
-    m2 = re.match(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$", q_text)
-    if m2:
-        try:
-            lat, lon = float(m2.group(1)), float(m2.group(2))
-            return lat, lon
-        except ValueError:
-            return None
-
-    return None
-
-
-def extract_lat_lon(feature: Dict[str, Any]) -> Optional[Tuple[float, float]]:
-    geom = feature.get("geometry") or {}
-    props = feature.get("properties") or {}
-
-    # 1. geometry.coordinates
-    if isinstance(geom, dict) and geom.get("type") == "Point":
-        coords = geom.get("coordinates")
-        if (
-            isinstance(coords, list)
-            and len(coords) >= 2
-            and coords[0] is not None
-            and coords[1] is not None
-        ):
-            lon, lat = float(coords[0]), float(coords[1])
-            # Skip 0,0 placeholder
-            if not (abs(lat) < 1e-12 and abs(lon) < 1e-12):
-                return lat, lon
-
-    # 2. google_maps_url
-    url = props.get("google_maps_url") or props.get("Google Maps URL")
-    if isinstance(url, str):
-        parsed = parse_latlon_from_url(url)
-        if parsed:
-            return parsed
-
-    return None
-
-
-def derive_name_from_url(url: str) -> Optional[str]:
-    """
-    Extract a human-readable name from q=<text> in the URL,
-    but only if q is NOT coordinates.
-    """
-    parsed = urlparse(url)
-    qs = parse_qs(parsed.query)
-    if "q" not in qs:
-        return None
-
-    q_raw = qs["q"][0]
-    q_text = unquote(q_raw.replace("+", " ")).strip()
-
-    # Skip pure lat,lon
-    if re.match(r"^\s*-?\d+(\.\d+)?\s*,\s*-?\d+(\.\d+)?\s*$", q_text):
-        return None
-
-    # Remove leading "m," garbage Google sometimes inserts
-    if q_text.lower().startswith("m,"):
-        q_text = q_text[2:].strip()
-
-    return q_text if q_text else None
-
-
-def extract_name_and_desc(feature: Dict[str, Any], idx: int) -> Tuple[str, str]:
-    props = feature.get("properties") or {}
-    loc = props.get("location") or {}
-
-    # 1. Prefer location.name (exists for your recycling centre)
-    if isinstance(loc, dict) and loc.get("name"):
-        name_val = str(loc["name"])
-    else:
-        name_val = None
-
-    # 2. Next: try q=<text> from URL
-    if not name_val:
-        url = props.get("google_maps_url") or props.get("Google Maps URL")
-        if isinstance(url, str):
-            name_from_url = derive_name_from_url(url)
-            if name_from_url:
-                name_val = name_from_url
-
-    # 3. Next: try explicit name/title/label fields
-    if not name_val:
-        for key in ["name", "Name", "title", "Title", "label", "Label"]:
-            if key in props and props[key]:
-                name_val = str(props[key])
-                break
-
-    # 4. Final fallback
-    if not name_val:
-        name_val = f"Saved Place {idx}"
-
-    # Build description
-    parts: List[str] = []
-    if props.get("date"):
-        parts.append(f"Saved: {props['date']}")
+from typing import Any, Dict, Iterable, List, TextIO
 
-    if isinstance(loc, dict) and loc.get("address"):
-        parts.append(f"Address: {loc['address']}")
+from saved_places_common import (
+    Record,
+    atomic_output,
+    format_coords,
+    iter_features,
+    iter_record_batches,
+)
 
-    url = props.get("google_maps_url") or props.get("Google Maps URL")
-    if isinstance(url, str):
-        parts.append(f"Google Maps: {url}")
 
-    comment = props.get("Comment") or props.get("comment")
-    if comment:
-        parts.append(str(comment))
+def build_desc(rec: Record) -> str:
+    parts: List[str] = []
+    if rec.date:
+        parts.append(f"Saved: {rec.date}")
 
-    desc_val = " | ".join(parts)
+    if rec.address:
+        parts.append(f"Address: {rec.address}")
 
-    return name_val, desc_val
+    if rec.url:
+        parts.append(f"Google Maps: {rec.url}")
 
+    if rec.comment:
+        parts.append(rec.comment)
 
-def feature_to_wpt(feature: Dict[str, Any], idx: int) -> str:
-    lat_lon = extract_lat_lon(feature)
-    if lat_lon is None:
-        return ""
+    return " | ".join(parts)
 
-    lat, lon = lat_lon
-    name, desc = extract_name_and_desc(feature, idx)
 
-    name_xml = html.escape(name, quote=True)
-    desc_xml = html.escape(desc, quote=True)
+def record_to_wpt(rec: Record, lat: str, lon: str) -> str:
+    """Render one waypoint; lat/lon come in already formatted."""
+    name_xml = html.escape(rec.name, quote=True)
+    desc_xml = html.escape(build_desc(rec), quote=True)
 
-    out = [
-        f'  <wpt lat="{lat:.8f}" lon="{lon:.8f}">',
-        f"    <name>{name_xml}</name>",
-    ]
     if desc_xml:
-        out.append(f"    <desc>{desc_xml}</desc>")
-    out.append("  </wpt>")
-    return "\n".join(out)
-
-
-def json_to_gpx(data: Dict[str, Any]) -> str:
-    features: List[Dict[str, Any]] = data.get("features") or []
-    wpts = []
-
-    for i, feat in enumerate(features, start=1):
-        w = feature_to_wpt(feat, i)
-        if w:
-            wpts.append(w)
-
-    return "\n".join([
-        '<?xml version="1.0" encoding="UTF-8"?>',
-        '<gpx version="1.1" creator="google-saved-to-gpx" '
-        'xmlns="http://www.topografix.com/GPX/1/1" '
-        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
-        'xsi:schemaLocation="http://www.topografix.com/GPX/1/1 '
-        'http://www.topografix.com/GPX/1/1/gpx.xsd">',
-        *wpts,
-        "</gpx>"
-    ])
+        return (
+            f'  <wpt lat="{lat}" lon="{lon}">\n'
+            f"    <name>{name_xml}</name>\n"
+            f"    <desc>{desc_xml}</desc>\n"
+            "  </wpt>"
+        )
+    return (
+        f'  <wpt lat="{lat}" lon="{lon}">\n'
+        f"    <name>{name_xml}</name>\n"
+        "  </wpt>"
+    )
+
+
+GPX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx version="1.1" creator="google-saved-to-gpx" '
+    'xmlns="http://www.topografix.com/GPX/1/1" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'xsi:schemaLocation="http://www.topografix.com/GPX/1/1 '
+    'http://www.topografix.com/GPX/1/1/gpx.xsd">\n'
+)
+
+
+def write_gpx(out: TextIO, features: Iterable[Dict[str, Any]]) -> int:
+    """Write a GPX document to out, a batch of waypoints at a time. Returns the waypoint count."""
+    write = out.write
+    write(GPX_HEADER)
+    count = 0
+    for batch in iter_record_batches(features):
+        lats = format_coords([rec.lat for rec in batch])
+        lons = format_coords([rec.lon for rec in batch])
+        write("".join(
+            record_to_wpt(rec, lat, lon) + "\n" for rec, lat, lon in zip(batch, lats, lons)
+        ))
+        count += len(batch)
+    write("</gpx>")
+    return count
 
 
 def main():
@@ -197,9 +81,9 @@ def main():
     parser.add_argument("output", type=Path)
     args = parser.parse_args()
 
-    data = load_json(args.input)
-    gpx = json_to_gpx(data)
-    args.output.write_text(gpx, encoding="utf-8")
+    features = iter_features(args.input)
+    with atomic_output(args.output) as out:
+        write_gpx(out, features)
     print("GPX written:", args.output)
 
 
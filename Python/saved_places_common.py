@@ -0,0 +1,307 @@
+"""Helpers shared by the Google Saved Places converters."""
+import contextlib
+import functools
+import itertools
+import json
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    TextIO,
+    Tuple,
+)
+from urllib.parse import urlparse, unquote_plus
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, stdlib json is used otherwise
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # optional, lets huge exports stream instead of loading whole
+    ijson = None
+
+_URL_Q_LATLON = re.compile(r"[?&]q=(-?\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?)")
+# q is either "lat,lon" or a place name, optionally with Google's "m," prefix
+_Q_DECODE = re.compile(
+    r"(?P<lat>-?\d+(?:\.\d+)?)\s*,\s*(?P<lon>-?\d+(?:\.\d+)?)"
+    r"|(?:m,)?(?P<name>.*)",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def _get_q(query: str) -> Optional[str]:
+    """Return the first non-empty q value of a query string, like parse_qs(query)["q"][0]."""
+    for kv in query.split("&"):
+        if kv.startswith("q=") and len(kv) > 2:
+            return unquote_plus(kv[2:])
+    return None
+
+
+@functools.lru_cache(maxsize=8192)
+def _decode_q(url: str) -> Optional[re.Match]:
+    """
+    Decode the q=... parameter of url in one regex pass. The match has
+    either lat/lon or name set; both URL helpers share this cached result.
+    """
+    if "q=" not in url:
+        return None
+    q_raw = _get_q(urlparse(url).query)
+    if not q_raw:
+        return None
+
+    q_text = unquote_plus(q_raw).strip()
+    return _Q_DECODE.fullmatch(q_text)
+
+
+def load_json(path: Path) -> Dict[str, Any]:
+    raw = path.read_bytes()
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # orjson is stricter (e.g. NaN, huge ints); let stdlib have a go
+            pass
+    return json.loads(raw)
+
+
+def iter_features(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Return an iterator over the features of a FeatureCollection.
+
+    With ijson installed the file is streamed, so memory stays flat no
+    matter how big the Takeout export is; otherwise it is loaded whole.
+    Either way a missing input fails before this returns, i.e. before
+    any output is touched, and a document without a "features" array
+    raises ValueError.
+    """
+    if ijson is None:
+        data = load_json(path)
+        features = data.get("features") if isinstance(data, dict) else None
+        if not isinstance(features, list):
+            raise ValueError(_NOT_A_COLLECTION.format(path=path))
+        return iter(features)
+
+    path.stat()  # fail early; the file itself is opened by the generator
+    return _stream_features(path)
+
+
+_NOT_A_COLLECTION = "{path}: not a GeoJSON FeatureCollection (no 'features' array)"
+
+
+def _stream_features(path: Path) -> Iterator[Dict[str, Any]]:
+    with path.open("rb") as f:
+        empty = True
+        for feat in ijson.items(f, "features.item", use_float=True):
+            empty = False
+            yield feat
+        if not empty:
+            return
+
+        # Nothing streamed: tell an empty collection from a non-collection
+        f.seek(0)
+        if ("features", "start_array", None) not in ijson.parse(f):
+            raise ValueError(_NOT_A_COLLECTION.format(path=path))
+
+
+def parse_latlon_from_url(url: str) -> Optional[Tuple[float, float]]:
+    """
+    Try to extract latitude, longitude from google_maps_url.
+
+    Works for URLs like:
+      http://maps.google.com/?q=50.82253,-0.13150
+    """
+    if not url:
+        return None
+
+    # Direct ?q=lat,lon
+    m = _URL_Q_LATLON.search(url)
+    if m:
+        try:
+            lat, lon = float(m.group(1)), float(m.group(2))
+            return lat, lon
+        except ValueError:
+            pass
+
+    # Fallback: parse query & inspect q
+    m2 = _decode_q(url)
+    if m2 is None or m2.group("lat") is None:
+        return None
+
+    try:
+        lat, lon = float(m2.group("lat")), float(m2.group("lon"))
+        return lat, lon
+    except ValueError:
+        return None
+
+
+def extract_lat_lon(
+    feature: Dict[str, Any], url: Optional[str] = None
+) -> Optional[Tuple[float, float]]:
+    """
+    Extract latitude/longitude from:
+      1) geometry.coordinates if non-zero
+      2) google_maps_url (?q=lat,lon)
+    """
+    geom = feature.get("geometry") or {}
+
+    # 1. geometry.coordinates
+    if isinstance(geom, dict) and geom.get("type") == "Point":
+        coords = geom.get("coordinates")
+        if isinstance(coords, list) and len(coords) >= 2:
+            c0, c1 = coords[0], coords[1]
+            # Numeric (0,0) is the usual placeholder; skip it without float()
+            if c0 is not None and c1 is not None and not (c0 == 0 and c1 == 0):
+                lon, lat = float(c0), float(c1)
+                # Also catches string or near-zero placeholders
+                if not (abs(lat) < 1e-12 and abs(lon) < 1e-12):
+                    return lat, lon
+
+    # 2. URL
+    if url is None:
+        props = feature.get("properties") or {}
+        url = props.get("google_maps_url") or props.get("Google Maps URL")
+    if isinstance(url, str):
+        parsed = parse_latlon_from_url(url)
+        if parsed:
+            return parsed
+
+    return None
+
+
+def derive_name_from_url(url: str) -> Optional[str]:
+    """
+    Try to extract a human-readable name from ?q=... in the URL,
+    but only if it isn't pure coordinates.
+    """
+    m = _decode_q(url)
+    # No q, or q is just lat,lon
+    if m is None or m.group("name") is None:
+        return None
+
+    # "m," prefix (Google sometimes adds it) is already dropped by the regex
+    return m.group("name").strip() or None
+
+
+class Record(NamedTuple):
+    """Everything the converters need from one located feature."""
+
+    lat: float
+    lon: float
+    name: str
+    url: str
+    date: str
+    address: str
+    comment: str
+
+
+def build_record(feature: Dict[str, Any], idx: int) -> Optional[Record]:
+    """
+    Walk a feature once and pull out coordinates, name and metadata.
+    Returns None for features that can't be located.
+    """
+    props = feature.get("properties") or {}
+    loc = props.get("location") or {}
+    if not isinstance(loc, dict):
+        loc = {}
+    url = props.get("google_maps_url") or props.get("Google Maps URL")
+    if not isinstance(url, str):
+        url = ""
+
+    latlon = extract_lat_lon(feature, url)
+    if latlon is None:
+        return None
+    lat, lon = latlon
+
+    # Name: location.name, then q=<text> from the URL, then label-ish
+    # fields, then a numbered fallback
+    name: Optional[str] = None
+    if loc.get("name"):
+        name = str(loc["name"])
+    if not name and url:
+        name = derive_name_from_url(url)
+    if not name:
+        for key in ("name", "Name", "title", "Title", "label", "Label"):
+            if props.get(key):
+                name = str(props[key])
+                break
+    if not name:
+        name = f"Saved Place {idx}"
+
+    comment = props.get("Comment") or props.get("comment")
+    return Record(
+        lat=lat,
+        lon=lon,
+        name=name,
+        url=url,
+        date=props.get("date") or "",
+        address=loc.get("address") or "",
+        comment=str(comment) if comment else "",
+    )
+
+
+BATCH_SIZE = 1024
+# Outputs are written in many small pieces; a big buffer keeps syscalls rare
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+
+@contextlib.contextmanager
+def atomic_output(path: Path, newline: Optional[str] = None) -> Iterator[TextIO]:
+    """
+    Open a temp file next to path for writing and move it over path only
+    if the block finishes, so a bad or truncated input never clobbers an
+    existing output.
+
+    Symlinks are followed and the existing file's mode is kept. Targets
+    that aren't regular files (FIFOs, /dev/stdout, ...) are written to
+    directly, since replacing them would break them.
+    """
+    if path.exists() and not path.is_file():
+        with path.open("w", encoding="utf-8", newline=newline, buffering=OUTPUT_BUFFER_SIZE) as out:
+            yield out
+        return
+
+    target = path.resolve()
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+    try:
+        with open(fd, "w", encoding="utf-8", newline=newline, buffering=OUTPUT_BUFFER_SIZE) as out:
+            yield out
+        if target.exists():
+            shutil.copymode(target, tmp)
+        else:
+            # mkstemp creates 0600; give new files the usual umask-based mode
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp, 0o666 & ~umask)
+        os.replace(tmp, target)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+
+
+def iter_record_batches(features: Iterable[Dict[str, Any]]) -> Iterator[List[Record]]:
+    """Yield located Records in lists of up to BATCH_SIZE, skipping the rest."""
+    records = (build_record(feat, i) for i, feat in enumerate(features, start=1))
+    located = (rec for rec in records if rec is not None)
+    while True:
+        batch = list(itertools.islice(located, BATCH_SIZE))
+        if not batch:
+            return
+        yield batch
+
+
+def format_coords(values: Sequence[float]) -> List[str]:
+    """Format floats as %.8f with one % call for the whole batch instead of one per value."""
+    return ("%.8f\0" * len(values) % tuple(values)).split("\0")[:-1]